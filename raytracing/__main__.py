@@ -9,26 +9,34 @@ from . import eo
 from . import olympus
 
 import argparse
+import multiprocessing
+import os
+import matplotlib.pyplot as plt
 
-ap = argparse.ArgumentParser(prog='python -m raytracing')
-ap.add_argument("-e", "--examples", required=False, default='all',
-                help="Specific example numbers, separated by a comma")
 
-args = vars(ap.parse_args())
-examples = args['examples']
+# When saving many figures, the same matplotlib figure is reused for all of them
+savedFigure = None
 
-if examples == 'all':
-    examples = range(1, 30)
-else:
-    examples = [int(y) for y in examples.split(',')]
 
-if 1 in examples:
+def showPath(path, filepath=None, **displayOptions):
+    """ Display the imaging path, or save its figure to filepath if it is provided """
+    global savedFigure
+
+    if filepath is None:
+        path.display(**displayOptions)
+    else:
+        if savedFigure is None:
+            savedFigure = plt.figure(figsize=(10, 7))
+        path.saveFigure(filepath, figure=savedFigure, **displayOptions)
+
+
+def demo1(filepath=None):
     path = ImagingPath()
     path.label = "Demo #1: lens f = 5cm, infinite diameter"
     path.append(Space(d=10))
     path.append(Lens(f=5))
     path.append(Space(d=10))
-    path.display(comments="""Demo #1: lens with f=5 cm, infinite diameter
+    showPath(path, filepath, comments="""Demo #1: lens with f=5 cm, infinite diameter
 
     An object at z=0 (front edge) is used. It is shown in blue. The image (or any intermediate images) are shown in red.\n\
     This will use the default objectHeight and fanAngle but they can be changed with:
@@ -46,7 +54,8 @@ if 1 in examples:
     path.display()
     """)
 
-if 2 in examples:
+
+def demo2(filepath=None):
     path = ImagingPath()
     path.label = "Demo #2: Two lenses, infinite diameters"
     path.append(Space(d=10))
@@ -54,7 +63,7 @@ if 2 in examples:
     path.append(Space(d=20))
     path.append(Lens(f=5))
     path.append(Space(d=10))
-    path.display(comments="""Demo #2: Two lenses, infinite diameters
+    showPath(path, filepath, comments="""Demo #2: Two lenses, infinite diameters
     An object at z=0 (front edge) is used with default properties (see Demo #1).
 
     Code:
@@ -70,14 +79,15 @@ if 2 in examples:
     # or
     # path.saveFigure("Figure 2.pdf")
 
-if 3 in examples:
+
+def demo3(filepath=None):
     path = ImagingPath()
     path.label = "Demo #3: Finite lens"
     path.append(Space(d=10))
     path.append(Lens(f=5, diameter=2.5))
     path.append(Space(d=3))
     path.append(Space(d=17))
-    path.display(comments="""Demo #3: A finite lens
+    showPath(path, filepath, comments="""Demo #3: A finite lens
     An object at z=0 (front edge) is used with default properties (see Demo #1). Notice the aperture stop (AS)
     identified at the lens which blocks the cone of light. There is no field stop to restrict the field of view,
     which is why we must use the default object and cannot restrict the field of view. Notice how the default
@@ -96,7 +106,9 @@ if 3 in examples:
     path.append(Space(d=17))
     path.display()
     """)
-if 4 in examples:
+
+
+def demo4(filepath=None):
     path = ImagingPath()
     path.label = "Demo #4: Aperture behind lens"
     path.append(Space(d=10))
@@ -104,7 +116,7 @@ if 4 in examples:
     path.append(Space(d=3))
     path.append(Aperture(diameter=3))
     path.append(Space(d=17))
-    path.display(comments="""Demo #4: Aperture behind lens
+    showPath(path, filepath, comments="""Demo #4: Aperture behind lens
 
     Notice the aperture stop (AS) identified after the lens, not at the lens. Again, since there is no field stop,
     we cannot restrict the object to the field of view because it is infinite.
@@ -119,7 +131,9 @@ if 4 in examples:
     path.append(Space(d=17))
     path.display()
     """)
-if 5 in examples:
+
+
+def demo5(filepath=None):
     path = ImagingPath()
     path.label = "Demo #5: Simple microscope system"
     path.fanAngle = 0.1  # full fan angle for rays
@@ -130,7 +144,7 @@ if 5 in examples:
     path.append(Space(d=4 + 18))
     path.append(Lens(f=18, diameter=5.0, label='Tube Lens'))
     path.append(Space(d=18))
-    path.display(limitObjectToFieldOfView=True, comments="""# Demo #5: Simple microscope system
+    showPath(path, filepath, limitObjectToFieldOfView=True, comments="""# Demo #5: Simple microscope system
     The aperture stop (AS) is at the entrance of the objective lens, and the tube lens, in this particular microscope, is
     the field stop (FS) and limits the field of view. Because the field stop exists, we can use limitObjectToFieldOfView=True
     when displaying, which will set the objectHeight to the field of view, but will still trace all the rays using our parameters.
@@ -147,7 +161,9 @@ if 5 in examples:
     path.append(Space(d=18))
     path.display()
     """)
-if 6 in examples:
+
+
+def demo6(filepath=None):
     path = ImagingPath()
     path.label = "Demo #6: Simple microscope system, only principal rays"
     path.append(Space(d=4))
@@ -155,8 +171,8 @@ if 6 in examples:
     path.append(Space(d=4 + 18))
     path.append(Lens(f=18, diameter=5.0, label='Tube Lens'))
     path.append(Space(d=18))
-    path.display(limitObjectToFieldOfView=True, onlyChiefAndMarginalRays=True,
-                 comments="""# Demo #6: Simple microscope system, only principal rays
+    showPath(path, filepath, limitObjectToFieldOfView=True, onlyChiefAndMarginalRays=True,
+             comments="""# Demo #6: Simple microscope system, only principal rays
     The aperture stop (AS) is at the entrance of the objective lens, and the tube lens, in this particular microscope, is
     the field stop (FS) and limits the field of view. Because the field stop exists, we can use limitObjectToFieldOfView=True
     when displaying, which will set the objectHeight to the field of view. We can also require that only the principal rays are drawn: chief ray
@@ -171,7 +187,9 @@ if 6 in examples:
     path.append(Space(d=18))
     path.display()
     """)
-if 7 in examples:
+
+
+def demo7(filepath=None):
     path = ImagingPath()
     path.label = "Demo #7: Focussing through a dielectric slab"
     path.append(Space(d=10))
@@ -179,7 +197,7 @@ if 7 in examples:
     path.append(Space(d=3))
     path.append(DielectricSlab(n=1.5, thickness=4))
     path.append(Space(d=10))
-    path.display(comments=path.label + """\n
+    showPath(path, filepath, comments=path.label + """\n
     path = ImagingPath()
     path.label = "Demo #7: Focussing through a dielectric slab"
     path.append(Space(d=10))
@@ -188,21 +206,25 @@ if 7 in examples:
     path.append(DielectricSlab(n=1.5, thickness=4))
     path.append(Space(d=10))"""
                  )
-if 8 in examples:
+
+
+def demo8(filepath=None):
     # Demo #8: Virtual image
     path = ImagingPath()
     path.label = "Demo #8: Virtual image at -2f with object at f/2"
     path.append(Space(d=2.5))
     path.append(Lens(f=5))
     path.append(Space(d=10))
-    path.display(comments=path.label + """\n
+    showPath(path, filepath, comments=path.label + """\n
     path = ImagingPath()
     path.label = "Demo #8: Virtual image at -2f with object at f/2"
     path.append(Space(d=2.5))
     path.append(Lens(f=5))
     path.append(Space(d=10))
     path.display()""")
-if 9 in examples:
+
+
+def demo9(filepath=None):
     # Demo #9: Infinite telecentric 4f telescope
     path = ImagingPath()
     path.label = "Demo #9: Infinite telecentric 4f telescope"
@@ -211,7 +233,7 @@ if 9 in examples:
     path.append(Space(d=10))
     path.append(Lens(f=5))
     path.append(Space(d=5))
-    path.display(comments=path.label + """\n
+    showPath(path, filepath, comments=path.label + """\n
     path = ImagingPath()
     path.label = "Demo #9: Infinite telecentric 4f telescope"
     path.append(Space(d=5))
@@ -220,7 +242,9 @@ if 9 in examples:
     path.append(Lens(f=5))
     path.append(Space(d=5))
     """)
-if 10 in examples:
+
+
+def demo10(filepath=None):
     path = ImagingPath()
     path.fanAngle = 0.05
     path.append(Space(d=20))
@@ -231,7 +255,7 @@ if 10 in examples:
     (focal, focal) = path.effectiveFocalLengths()
     bfl = path.backFocalLength()
     path.label = "Demo #10: Retrofocus $f_e$={0:.1f} cm, and BFL={1:.1f}".format(focal, bfl)
-    path.display(comments=path.label + """\n
+    showPath(path, filepath, comments=path.label + """\n
     A retrofocus has a back focal length longer than the effective focal length. It comes from a diverging lens followed by a converging
     lens. We can always obtain the effective focal lengths and the back focal length of a system.
 
@@ -247,7 +271,9 @@ if 10 in examples:
     path.label = "Demo #10: Retrofocus $f_e$={0:.1f} cm, and BFL={1:.1f}".format(focal, bfl)
     path.display()
     """)
-if 11 in examples:
+
+
+def demo11(filepath=None):
     # Demo #11: Thick diverging lens
     path = ImagingPath()
     path.label = "Demo #11: Thick diverging lens"
@@ -255,7 +281,7 @@ if 11 in examples:
     path.append(Space(d=50))
     path.append(ThickLens(R1=-20, R2=20, n=1.55, thickness=10, diameter=25, label='Lens'))
     path.append(Space(d=50))
-    path.display(onlyChiefAndMarginalRays=True, comments=path.label + """\n
+    showPath(path, filepath, onlyChiefAndMarginalRays=True, comments=path.label + """\n
     path = ImagingPath()
     path.label = "Demo #11: Thick diverging lens"
     path.objectHeight = 20
@@ -263,7 +289,9 @@ if 11 in examples:
     path.append(ThickLens(R1=-20, R2=20, n=1.55, thickness=10, diameter=25, label='Lens'))
     path.append(Space(d=50))
     path.display()""")
-if 12 in examples:
+
+
+def demo12(filepath=None):
     # Demo #12: Thick diverging lens built from individual elements
     path = ImagingPath()
     path.label = "Demo #12: Thick diverging lens built from individual elements"
@@ -273,7 +301,7 @@ if 12 in examples:
     path.append(Space(d=10, diameter=25, label='Lens'))
     path.append(DielectricInterface(R=20, n1=1.55, n2=1.0, diameter=25, label='Back'))
     path.append(Space(d=50))
-    path.display(onlyChiefAndMarginalRays=True, comments=path.label + """\n
+    showPath(path, filepath, onlyChiefAndMarginalRays=True, comments=path.label + """\n
     path = ImagingPath()
     path.label = "Demo #12: Thick diverging lens built from individual elements"
     path.objectHeight = 20
@@ -284,7 +312,8 @@ if 12 in examples:
     path.append(Space(d=50))
     path.display()""")
 
-if 13 in examples:
+
+def demo13(filepath=None):
     # Demo #13, forward and backward conjugates
     # We can obtain the position of the image for any matrix
     # by using forwardConjugate(): it calculates the distance
@@ -295,7 +324,9 @@ if 13 in examples:
     M3 = M2 * M1
     print(M3.forwardConjugate())
     print(M3.backwardConjugate())
-if 14 in examples:
+
+
+def demo14(filepath=None):
     # Demo #14: Generic objectives
     obj = Objective(f=10, NA=0.8, focusToFocusLength=60, backAperture=18, workingDistance=2, label="Objective")
     print("Focal distances: ", obj.focalDistances())
@@ -312,7 +343,7 @@ if 14 in examples:
     path.append(Space(180))
     path.append(obj)
     path.append(Space(10))
-    path.display(comments=path.label + """
+    showPath(path, filepath, comments=path.label + """
     path = ImagingPath()
     path.fanAngle = 0.0
     path.fanNumber = 1
@@ -323,7 +354,9 @@ if 14 in examples:
     path.append(obj)
     path.append(Space(10))
     path.display()""")
-if 15 in examples:
+
+
+def demo15(filepath=None):
     # Demo #15: Olympus objective LUMPlanFL40X
     path = ImagingPath()
     path.fanAngle = 0.0
@@ -333,7 +366,7 @@ if 15 in examples:
     path.label = "Demo #15 Path with LUMPlanFL40X"
     path.append(Space(180))
     path.append(olympus.LUMPlanFL40X())
-    path.display(comments=path.label + """
+    showPath(path, filepath, comments=path.label + """
     path = ImagingPath()
     path.fanAngle = 0.0
     path.fanNumber = 1
@@ -344,11 +377,16 @@ if 15 in examples:
     path.append(olympus.LUMPlanFL40X())
     path.append(Space(10))
     path.display()""")
-if 16 in examples:
+
+
+def demo16(filepath=None):
     # Demo #16: Vendor lenses
-    thorlabs.AC254_050_A().display()
-    eo.PN_33_921().display()
-if 17 in examples:
+    if filepath is None:  # Element graphics can only be displayed
+        thorlabs.AC254_050_A().display()
+        eo.PN_33_921().display()
+
+
+def demo17(filepath=None):
     # Demo #17: Vendor lenses
     path = ImagingPath()
     path.label = "Demo #17: Vendor Lenses"
@@ -363,7 +401,7 @@ if 17 in examples:
     path.append(Space(180))
     path.append(olympus.LUMPlanFL40X())
     path.append(Space(10))
-    path.display(comments=path.label + """\n
+    showPath(path, filepath, comments=path.label + """\n
     path = ImagingPath()
     path.label = "Demo #17: Vendor Lenses"
     path.append(Space(d=50))
@@ -378,7 +416,9 @@ if 17 in examples:
     path.append(olympus.LUMPlanFL40X())
     path.append(Space(10))
     path.display()""")
-if 18 in examples:
+
+
+def demo18(filepath=None):
     # Demo #18: Laser beam and vendor lenses
     path = LaserPath()
     path.label = "Demo #18: Laser beam and vendor lenses"
@@ -393,7 +433,7 @@ if 18 in examples:
     path.append(Space(d=180))
     path.append(olympus.LUMPlanFL40X())
     path.append(Space(d=10))
-    path.display(beams=[GaussianBeam(w=0.001)], comments="""
+    path.display(beams=[GaussianBeam(w=0.001)], filepath=filepath, comments="""
     path = LaserPath()
     path.label = "Demo #18: Laser beam and vendor lenses"
     path.append(Space(d=50))
@@ -408,7 +448,9 @@ if 18 in examples:
     path.append(olympus.LUMPlanFL40X())
     path.append(Space(d=10))
     path.display()""")
-if 19 in examples:
+
+
+def demo19(filepath=None):
     cavity = LaserCavity(label="Laser cavity: round trip\nCalculated laser modes")
     cavity.append(Space(d=160))
     cavity.append(DielectricSlab(thickness=100, n=1.8))
@@ -428,4 +470,57 @@ if 19 in examples:
         print(q)
 
     # Show
-    cavity.display()
+    cavity.display(filepath=filepath)
+
+
+demos = {1: demo1, 2: demo2, 3: demo3, 4: demo4, 5: demo5, 6: demo6, 7: demo7, 8: demo8, 9: demo9,
+         10: demo10, 11: demo11, 12: demo12, 13: demo13, 14: demo14, 15: demo15, 16: demo16,
+         17: demo17, 18: demo18, 19: demo19}
+
+
+def useNonInteractiveBackend():
+    plt.switch_backend('Agg')
+
+
+def saveDemo(example, outputDirectory):
+    """ Run the demo and save its figure as a PNG file in outputDirectory.
+    Returns the path of the file, or None if the demo has no figure to save. """
+    filepath = os.path.join(outputDirectory, "Demo{0}.png".format(example))
+    if os.path.exists(filepath):
+        os.remove(filepath)  # A file left by an earlier run is not this demo's figure
+    demos[example](filepath=filepath)
+    if os.path.exists(filepath):
+        return filepath
+    return None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(prog='python -m raytracing')
+    ap.add_argument("-e", "--examples", required=False, default='all',
+                    help="Specific example numbers, separated by a comma")
+    ap.add_argument("-o", "--output", required=False, default=None,
+                    help="Save the figures as PNG files in this directory instead of displaying them. "
+                         "The examples are then computed in parallel.")
+
+    args = vars(ap.parse_args())
+    examples = args['examples']
+
+    if examples == 'all':
+        examples = range(1, 30)
+    else:
+        examples = [int(y) for y in examples.split(',')]
+    examples = [example for example in examples if example in demos]
+
+    outputDirectory = args['output']
+    if outputDirectory is None:
+        for example in examples:
+            demos[example]()
+    else:
+        os.makedirs(outputDirectory, exist_ok=True)
+        useNonInteractiveBackend()
+        with multiprocessing.Pool(initializer=useNonInteractiveBackend) as pool:
+            filepaths = pool.starmap(saveDemo, [(example, outputDirectory) for example in examples])
+
+        for filepath in filepaths:
+            if filepath is not None:
+                print("Saved {0}".format(filepath))
@@ -0,0 +1,93 @@
+""" Compiled versions of the few loops that dominate the calculations with
+long groups of matrices. Numba is optional: if it is not installed, the same
+functions are used as plain Python and HAS_NUMBA is False, so callers can
+give them Python lists instead of numpy arrays (a plain Python loop is
+faster on lists).
+
+The compiled functions are cached on disk (in __pycache__), so they are
+only compiled the first time they are used, not every time raytracing
+is imported.
+"""
+
+import numpy as np
+
+try:
+    import numba
+
+    HAS_NUMBA = True
+    jit = numba.njit(cache=True)
+except ImportError:
+    HAS_NUMBA = False
+
+    def jit(function):
+        return function
+
+
+@jit
+def chain(A, B, C, D):
+    """ The product of the ABCD matrices of a sequence of elements, in the order
+    the rays go through them (i.e. Mn * ... * M2 * M1), starting from the
+    identity as MatrixGroup.transferMatrix() does.
+
+    Parameters
+    ----------
+    A, B, C, D : array or list of floats
+        The A, B, C and D values of each element
+
+    Returns
+    -------
+    a, b, c, d : float
+        The ABCD values of the product
+    frontElement, backElement : int
+        The index of the elements whose frontIndex and backIndex
+        the product takes with the rules of Matrix.mul_matrix(),
+        or -1 if it keeps the indices of the identity matrix.
+    """
+    a, b, c, d = 1.0, 0.0, 0.0, 1.0
+    frontElement, backElement = -1, -1
+    for i in range(len(A)):
+        if A[i] == 1 and D[i] == 1 and B[i] == 0 and C[i] == 0:
+            pass  # The element is the identity: the product keeps its indices
+        elif a == 1 and d == 1 and b == 0 and c == 0:
+            frontElement, backElement = i, i
+        else:
+            backElement = i
+
+        a, b, c, d = (A[i] * a + B[i] * c, A[i] * b + B[i] * d,
+                      C[i] * a + D[i] * c, C[i] * b + D[i] * d)
+
+    return a, b, c, d, frontElement, backElement
+
+
+@jit
+def prefixProducts(A, B, C, D):
+    """ All the partial products M1, M2 * M1, ..., Mn * ... * M1 of the ABCD
+    matrices of a sequence of elements, as obtained one element at a time
+    with element * transferMatrix.
+
+    Parameters
+    ----------
+    A, B, C, D : array or list of floats
+        The A, B, C and D values of each element
+
+    Returns
+    -------
+    a, b, c, d : arrays of floats
+        The ABCD values of the product after each element
+    """
+    n = len(A)
+    a = np.empty(n)
+    b = np.empty(n)
+    c = np.empty(n)
+    d = np.empty(n)
+    an, bn, cn, dn = 1.0, 0.0, 0.0, 1.0
+    for i in range(n):
+        an, bn, cn, dn = (A[i] * an + B[i] * cn, A[i] * bn + B[i] * dn,
+                          C[i] * an + D[i] * cn, C[i] * bn + D[i] * dn)
+        a[i] = an
+        b[i] = bn
+        c[i] = cn
+        d[i] = dn
+
+    return a, b, c, d
+
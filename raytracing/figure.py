@@ -1,13 +1,27 @@
 from typing import List, Union
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from matplotlib import path as mpath
 from .matrix import *
 from .matrixgroup import *
 from .specialtylenses import *
+import builtins
 import warnings
 
 
+def _gatherLabels(labels, pointsOfInterest):
+    """ Add the labels of the points of interest to a dictionary of labels by
+    position (rounded to 3 decimals), joining the labels at the same position. """
+    for pointOfInterest in pointsOfInterest:
+        zKey = builtins.round(pointOfInterest['z'], 3)  # The round() of numpy is imported with *
+        label = pointOfInterest['label']
+        if zKey in labels:
+            labels[zKey] = labels[zKey] + ", " + label
+        else:
+            labels[zKey] = label
+
+
 class Figure:
     def __init__(self, opticalPath):
         self.path = opticalPath
@@ -15,6 +29,7 @@ class Figure:
         self.axes = None  # Where the optical system is
         self.axesComments = None  # Where the comments are (for teaching)
         self.elementGraphics = []
+        self._elementHalfHeights = []  # Same order as elementGraphics
 
         self.styles = dict()
         self.styles['default'] = {'rayColors': ['b', 'r', 'g'], 'onlyAxialRay': False,
@@ -28,14 +43,33 @@ class Figure:
 
         self.designParams = self.styles['default']
 
-    def createFigure(self, comments=None, title=None):
+    def createFigure(self, comments=None, title=None, figure=None):
+        """ Create the matplotlib figure and its axes for the optical path,
+        with the comments (if any) in the bottom half.
+
+        Parameters
+        ----------
+        comments : string
+            If comments are included they will be displayed on a graph in the bottom half of the plot. (default=None)
+        title : string
+            The title of the plot (default=None)
+        figure : matplotlib.figure.Figure
+            If provided, this existing figure is cleared and reused instead of
+            creating a new one, which is much faster when many figures are saved. (default=None)
+        """
+        if figure is None:
+            figure = plt.figure(figsize=(10, 7))
+        else:
+            figure.clear()
+        self.figure = figure
+
         if comments is not None:
-            self.figure, (self.axes, self.axesComments) = plt.subplots(2, 1, figsize=(10, 7))
+            (self.axes, self.axesComments) = self.figure.subplots(2, 1)
             self.axesComments.axis('off')
             self.axesComments.text(0., 1.0, comments, transform=self.axesComments.transAxes,
                                    fontsize=10, verticalalignment='top')
         else:
-            self.figure, self.axes = plt.subplots(figsize=(10, 7))
+            self.axes = self.figure.subplots()
 
         self.axes.set(xlabel='Distance', ylabel='Height', title=title)
 
@@ -278,9 +312,8 @@ class Figure:
 
     def imagingDisplayRange(self):
         displayRange = 0
-        for graphic in self.elementGraphics:
-            if graphic.halfHeight * 2 > displayRange:
-                displayRange = graphic.halfHeight * 2
+        if len(self._elementHalfHeights) != 0:
+            displayRange = float(np.max(self._elementHalfHeights)) * 2
 
         if displayRange == float('+Inf') or displayRange <= self.path._objectHeight:
             displayRange = self.path._objectHeight
@@ -298,9 +331,8 @@ class Figure:
 
     def laserDisplayRange(self):
         displayRange = 0
-        for graphic in self.elementGraphics:
-            if graphic.halfHeight * 2 > displayRange:
-                displayRange = graphic.halfHeight * 2
+        if len(self._elementHalfHeights) != 0:
+            displayRange = float(np.max(self._elementHalfHeights)) * 2
 
         if displayRange == float('+Inf') or displayRange == 0:
             if self.path.inputBeam is not None:
@@ -429,30 +461,15 @@ class Figure:
 
         zElement = 0
         # For the group as a whole, then each element
-        for pointOfInterest in self.path.pointsOfInterest(z=zElement):
-            zStr = "{0:3.3f}".format(pointOfInterest['z'])
-            label = pointOfInterest['label']
-            if zStr in labels:
-                labels[zStr] = labels[zStr] + ", " + label
-            else:
-                labels[zStr] = label
+        _gatherLabels(labels, self.path.pointsOfInterest(z=zElement))
 
         # Points of interest for each element
         for element in self.path.elements:
-            pointsOfInterest = element.pointsOfInterest(zElement)
-
-            for pointOfInterest in pointsOfInterest:
-                zStr = "{0:3.3f}".format(pointOfInterest['z'])
-                label = pointOfInterest['label']
-                if zStr in labels:
-                    labels[zStr] = labels[zStr] + ", " + label
-                else:
-                    labels[zStr] = label
+            _gatherLabels(labels, element.pointsOfInterest(zElement))
             zElement += element.L
 
         halfHeight = self.path.largestDiameter / 2
-        for zStr, label in labels.items():
-            z = float(zStr)
+        for z, label in labels.items():
             self.axes.annotate(label, xy=(z, 0.0), xytext=(z, -halfHeight * 0.5),
                                xycoords='data', fontsize=12,
                                ha='center', va='bottom')
@@ -531,16 +548,20 @@ class Figure:
 
     def drawElements(self, elements):
         self.elementGraphics = []
-        z = 0
-        for element in elements:
+        self._elementHalfHeights = []
+
+        # The front edge of each element is after all the elements before it
+        lengths = np.array([element.L for element in elements], dtype=float)
+        positions = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+        for element, z in zip(elements, positions.tolist()):
             graphic = Graphic(element)
             graphic.drawAt(z, self.axes)
             graphic.drawAperture(z, self.axes)
 
             if self.path.showElementLabels:
                 graphic.drawLabels(z, self.axes)
-            z += graphic.L
             self.elementGraphics.append(graphic)
+            self._elementHalfHeights.append(graphic.halfHeight)
 
     def rayTraceLines(self, removeBlockedRaysCompletely=True):
         """ A list of all ray trace line objects corresponding to either
@@ -568,12 +589,14 @@ class Figure:
                 N=self.path.fanNumber)
             linewidth = 0.5
 
-        manyRayTraces = self.path.traceMany(rayGroup)
+        if self.canTraceAsArrays():
+            manyRayCoordinates = self.rayTraceCoordinates(rayGroup, removeBlockedRaysCompletely)
+        else:
+            manyRayCoordinates = [self.rearrangeRayTraceForPlotting(rayTrace, removeBlockedRaysCompletely)
+                                  for rayTrace in self.path.traceMany(rayGroup)]
 
         lines = []
-        for rayTrace in manyRayTraces:
-            (x, y) = self.rearrangeRayTraceForPlotting(
-                rayTrace, removeBlockedRaysCompletely)
+        for (x, y) in manyRayCoordinates:
             if len(y) == 0:
                 continue  # nothing to plot, ray was fully blocked
 
@@ -594,6 +617,35 @@ class Figure:
 
         return lines
 
+    def canTraceAsArrays(self):
+        """ True if the rays can be propagated all at once through the path
+        with rayTraceCoordinates(). See MatrixGroup.canTraceAsArrays(). """
+        return self.path.canTraceAsArrays()
+
+    def rayTraceCoordinates(self, rayGroup, removeBlockedRaysCompletely=True):
+        """ The (z, y) coordinates of each ray of rayGroup through the path,
+        as obtained with rearrangeRayTraceForPlotting(path.trace(ray)), but
+        with all rays propagated at once with MatrixGroup.traceAsArrays().
+
+        Parameters
+        ----------
+        rayGroup : List of Rays
+            The rays to trace
+        removeBlockedRaysCompletely : bool
+            If True, the blocked rays will have no coordinates (default=True)
+        """
+        (zs, ys, thetas, blocked) = self.path.traceAsArrays(rayGroup)
+
+        manyRayCoordinates = []
+        for i in range(len(rayGroup)):
+            if removeBlockedRaysCompletely and blocked[i].any():
+                manyRayCoordinates.append(([], []))
+            else:
+                isVisible = ~blocked[i]
+                manyRayCoordinates.append((zs[i][isVisible], ys[i][isVisible]))
+
+        return manyRayCoordinates
+
     def rearrangeRayTraceForPlotting(self, rayList: List[Ray],
                                      removeBlockedRaysCompletely=True):
         """
@@ -638,15 +690,7 @@ class Figure:
     def _showPlot(self):
         try:
             plt.plot()
-            if sys.platform.startswith('win'):
-                plt.show()
-            else:
-                plt.draw()
-                while True:
-                    if plt.get_fignums():
-                        plt.pause(0.001)
-                    else:
-                        break
+            plt.show(block=True)
 
         except KeyboardInterrupt:
             plt.close()
@@ -817,17 +861,10 @@ class MatrixGraphic:
 
         """
         labels = {}  # Gather labels at same z
-        for pointOfInterest in self.matrix.pointsOfInterest(z=z):
-            zStr = "{0:3.3f}".format(pointOfInterest['z'])
-            label = pointOfInterest['label']
-            if zStr in labels:
-                labels[zStr] = labels[zStr] + ", " + label
-            else:
-                labels[zStr] = label
+        _gatherLabels(labels, self.matrix.pointsOfInterest(z=z))
 
         halfHeight = self.displayHalfHeight()
-        for zStr, label in labels.items():
-            z = float(zStr)
+        for z, label in labels.items():
             axes.annotate(label, xy=(z, 0.0), xytext=(z, -halfHeight * 0.5),
                           xycoords='data', fontsize=12,
                           ha='center', va='bottom')
@@ -963,15 +1000,7 @@ class MatrixGraphic:
         # internal, do not use
         try:
             plt.plot()
-            if sys.platform.startswith('win'):
-                plt.show()
-            else:
-                plt.draw()
-                while True:
-                    if plt.get_fignums():
-                        plt.pause(0.001)
-                    else:
-                        break
+            plt.show(block=True)
 
         except KeyboardInterrupt:
             plt.close()
@@ -1214,14 +1243,15 @@ class MatrixGroupGraphic(MatrixGraphic):
 
     def drawAt(self, z, axes, showLabels=True):
         """ Draw each element of this group """
-        for element in self.matrixGroup:
+        lengths = [element.L for element in self.matrixGroup.elements]
+        elementPositions = np.concatenate(([0.0], np.cumsum(lengths)[:-1])).tolist()
+        for element, zElement in zip(self.matrixGroup.elements, elementPositions):
             graphic = Graphic(element)
-            graphic.drawAt(z, axes)
-            graphic.drawAperture(z, axes)
+            graphic.drawAt(z + zElement, axes)
+            graphic.drawAperture(z + zElement, axes)
 
             if showLabels:
-                graphic.drawLabels(z, axes)
-            z += graphic.L
+                graphic.drawLabels(z + zElement, axes)
 
     def drawPointsOfInterest(self, z, axes):
         """
@@ -1232,32 +1262,17 @@ class MatrixGroupGraphic(MatrixGraphic):
         """
         labels = {}  # Gather labels at same z
 
-        zElement = 0
         # For the group as a whole, then each element
-        for pointOfInterest in self.matrixGroup.pointsOfInterest(z=zElement):
-            zStr = "{0:3.3f}".format(pointOfInterest['z'])
-            label = pointOfInterest['label']
-            if zStr in labels:
-                labels[zStr] = labels[zStr] + ", " + label
-            else:
-                labels[zStr] = label
+        _gatherLabels(labels, self.matrixGroup.pointsOfInterest(z=0))
 
         # Points of interest for each element
-        for element in self.matrixGroup.elements:
-            pointsOfInterest = element.pointsOfInterest(zElement)
-
-            for pointOfInterest in pointsOfInterest:
-                zStr = "{0:3.3f}".format(pointOfInterest['z'])
-                label = pointOfInterest['label']
-                if zStr in labels:
-                    labels[zStr] = labels[zStr] + ", " + label
-                else:
-                    labels[zStr] = label
-            zElement += element.L
+        lengths = [element.L for element in self.matrixGroup.elements]
+        elementPositions = np.concatenate(([0.0], np.cumsum(lengths)[:-1])).tolist()
+        for element, zElement in zip(self.matrixGroup.elements, elementPositions):
+            _gatherLabels(labels, element.pointsOfInterest(zElement))
 
         halfHeight = self.matrixGroup.largestDiameter / 2
-        for zStr, label in labels.items():
-            z = float(zStr)
+        for z, label in labels.items():
             axes.annotate(label, xy=(z, 0.0), xytext=(z, -halfHeight * 0.5),
                           xycoords='data', fontsize=12,
                           ha='center', va='bottom')
@@ -1277,15 +1292,7 @@ class MatrixGroupGraphic(MatrixGraphic):
         # internal, do not use
         try:
             plt.plot()
-            if sys.platform.startswith('win'):
-                plt.show()
-            else:
-                plt.draw()
-                while True:
-                    if plt.get_fignums():
-                        plt.pause(0.001)
-                    else:
-                        break
+            plt.show(block=True)
 
         except KeyboardInterrupt:
             plt.close()
@@ -4,10 +4,34 @@ from .matrixgroup import *
 
 from .ray import *
 from .figure import Figure
+import functools
 import sys
 import warnings
 
 
+def cachedUntilModified(method):
+    """ Decorator for the analysis methods of ImagingPath (without arguments)
+    that keeps their result in the cache of the group, which is cleared every
+    time the path (or a nested group) is modified: as for the other values of
+    the group, an element changed directly is not seen (see MatrixGroup). We also
+    compare the constants used for the calculations in case they were changed. """
+
+    @functools.wraps(method)
+    def cachedMethod(self):
+        cache = self._validCache()
+        state = (self.precision, self.maxHeight)
+        if method.__name__ in cache:
+            (cachedState, result) = cache[method.__name__]
+            if cachedState == state:
+                return result
+
+        result = method(self)
+        cache[method.__name__] = (state, result)
+        return result
+
+    return cachedMethod
+
+
 class ImagingPath(MatrixGroup):
     """ImagingPath: the main class of the module, allowing
     the combination of Matrix() or MatrixGroup() to be used 
@@ -316,6 +340,7 @@ class ImagingPath(MatrixGroup):
         rayUp, rayDown = self.marginalRays()
         return rayUp
 
+    @cachedUntilModified
     def apertureStop(self):
         """The "aperture stop" is an aperture in the system that limits
         the cone of angles originating from zero height at the object plane.
@@ -434,6 +459,7 @@ class ImagingPath(MatrixGroup):
         else:
             return (None, None)
 
+    @cachedUntilModified
     def fieldStop(self):
         """ The field stop is the aperture that limits the image size (or field of view)
         It is possible to have finite diameter elements but
@@ -530,6 +556,7 @@ class ImagingPath(MatrixGroup):
 
         return (fieldStopPosition, fieldStopDiameter)
 
+    @cachedUntilModified
     def fieldOfView(self):
         """The field of view is the maximum object height
         visible until its chief ray is blocked by the field stop.
@@ -590,6 +617,7 @@ class ImagingPath(MatrixGroup):
 
         return chiefRay.y * 2.0
 
+    @cachedUntilModified
     def imageSize(self):
         """The image size is the object field of view multiplied by magnification.
         This value is independent from the height of the object.
@@ -621,6 +649,25 @@ class ImagingPath(MatrixGroup):
         magnification = conjugateMatrix.A
         return abs(fieldOfView * magnification)
 
+    def intermediateConjugates(self):
+        """ This function calculates the position and the magnification of the conjugate planes.
+        The planes are calculated only once until the path is modified.
+
+        Returns
+        -------
+        planes : List
+            The list of position and magnification of conjugate planes
+
+        See Also
+        --------
+        raytracing.MatrixGroup.intermediateConjugates
+        """
+        return [plane[:] for plane in self._intermediateConjugates()]
+
+    @cachedUntilModified
+    def _intermediateConjugates(self):
+        return super(ImagingPath, self).intermediateConjugates()
+
     def lagrangeInvariant(self, ray1=None, ray2=None, z=0):
         """
         The Lagrange invariant is a quantity that is conserved
@@ -688,7 +735,7 @@ class ImagingPath(MatrixGroup):
 
     def display(self, onlyPrincipalAndAxialRays=True,
                 removeBlockedRaysCompletely=False, comments=None,
-                limitObjectToFieldOfView=None, onlyChiefAndMarginalRays=None):
+                limitObjectToFieldOfView=None, onlyChiefAndMarginalRays=None, figure=None):
         """ Display the optical system and trace the rays.
 
         Parameters
@@ -702,6 +749,8 @@ class ImagingPath(MatrixGroup):
             If True, the blocked rays are removed (default=False)
         comments : string
             If comments are included they will be displayed on a graph in the bottom half of the plot. (default=None)
+        figure : matplotlib.figure.Figure
+            If provided, this existing figure is cleared and reused instead of creating a new one. (default=None)
 
         """
         if onlyChiefAndMarginalRays is not None:
@@ -711,7 +760,7 @@ class ImagingPath(MatrixGroup):
         if limitObjectToFieldOfView is not None:
             self.figure.designParams['limitObjectToFieldOfView'] = limitObjectToFieldOfView
 
-        self.figure.createFigure(title=self.label, comments=comments)
+        self.figure.createFigure(title=self.label, comments=comments, figure=figure)
 
         self.figure.display(onlyPrincipalAndAxialRays=onlyPrincipalAndAxialRays,
                             removeBlockedRaysCompletely=removeBlockedRaysCompletely)
@@ -719,7 +768,7 @@ class ImagingPath(MatrixGroup):
     def saveFigure(self, filepath,
                    onlyPrincipalAndAxialRays=True,
                    removeBlockedRaysCompletely=False, comments=None,
-                   limitObjectToFieldOfView=None, onlyChiefAndMarginalRays=None):
+                   limitObjectToFieldOfView=None, onlyChiefAndMarginalRays=None, figure=None):
         """
         The figure of the imaging path can be saved using this function.
 
@@ -738,6 +787,8 @@ class ImagingPath(MatrixGroup):
             If True, the blocked rays are removed (default=False)
         comments : string
             If comments are included they will be displayed on a graph in the bottom half of the plot. (default=None)
+        figure : matplotlib.figure.Figure
+            If provided, this existing figure is cleared and reused instead of creating a new one. (default=None)
 
         """
         if onlyChiefAndMarginalRays is not None:
@@ -747,7 +798,7 @@ class ImagingPath(MatrixGroup):
         if limitObjectToFieldOfView is not None:
             self.figure.designParams['limitObjectToFieldOfView'] = limitObjectToFieldOfView
 
-        self.figure.createFigure(title=self.label, comments=comments)
+        self.figure.createFigure(title=self.label, comments=comments, figure=figure)
 
         self.figure.display(onlyPrincipalAndAxialRays=onlyPrincipalAndAxialRays,
                             removeBlockedRaysCompletely=removeBlockedRaysCompletely,
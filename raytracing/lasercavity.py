@@ -83,7 +83,7 @@ class LaserCavity(LaserPath):
 
         return q
 
-    def display(self, comments=None):  # pragma: no cover
+    def display(self, comments=None, filepath=None):  # pragma: no cover
         """ Display the optical cavity and trace the laser beam. 
         If comments are included they will be displayed on a
         graph in the bottom half of the plot.
@@ -93,10 +93,12 @@ class LaserCavity(LaserPath):
         comments : string
             If comments are included they will be displayed on a 
             graph in the bottom half of the plot. (default=None)
+        filepath : str or PathLike or file-like object
+            If provided, the figure is saved to filepath instead of being displayed. (default=None)
 
         """
         beams = self.laserModes()
         if len(beams) == 0:
             print("Cavity is not stable")
 
-        super(LaserCavity, self).display(beams=beams)
+        super(LaserCavity, self).display(beams=beams, filepath=filepath)
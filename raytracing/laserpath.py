@@ -53,7 +53,7 @@ class LaserPath(MatrixGroup):
         self.showPlanesAcrossPointsOfInterest = True
         super(LaserPath, self).__init__(elements=elements, label=label)
 
-    def display(self, beams=None, comments=None):  # pragma: no cover
+    def display(self, beams=None, comments=None, filepath=None):  # pragma: no cover
         """ Display the optical system and trace the laser beam. 
         If comments are included they will be displayed on a
         graph in the bottom half of the plot.
@@ -65,6 +65,8 @@ class LaserPath(MatrixGroup):
             A list of Gaussian beams
         comments : string
             If comments are included they will be displayed on a graph in the bottom half of the plot. (default=None)
+        filepath : str or PathLike or file-like object
+            If provided, the figure is saved to filepath instead of being displayed. (default=None)
 
         """
         if beams is None :
@@ -74,4 +76,4 @@ class LaserPath(MatrixGroup):
 
         figure.createFigure(title=self.label, comments=comments)
 
-        figure.displayGaussianBeam(beams=beams)
+        figure.displayGaussianBeam(beams=beams, filepath=filepath)
@@ -558,6 +558,21 @@ class Matrix(object):
 
         return matrix.backIndex * (outputRay1.theta * outputRay2.y - outputRay1.y * outputRay2.theta)
 
+    @property
+    def traceLength(self):
+        """ The number of rays in the ray trace of a Ray() with trace():
+        the ray at the entrance of an element of finite length,
+        and the ray after the element.
+
+        Returns
+        -------
+        traceLength : int
+            The number of rays returned by trace(ray)
+        """
+        if self.L > 0:
+            return 2
+        return 1
+
     def trace(self, ray):
         """The ray matrix formalism, through multiplication of a ray by 
         a matrix, will give the correct ray but will never consider apertures.
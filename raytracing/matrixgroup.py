@@ -1,6 +1,10 @@
 from .matrix import *
+from ._fast import chain, prefixProducts, HAS_NUMBA
+import numpy as np
 
 import collections.abc as collections
+import bisect
+import itertools
 
 
 class MatrixGroup(Matrix):
@@ -14,16 +18,29 @@ class MatrixGroup(Matrix):
         A list of ABCD matrices in the imaging path
     label : string
         the label for the imaging path (Optional)
+
+    Notes
+    -----
+    The values calculated from the elements are kept until the group is modified
+    with its own methods (append(), insert(), pop(), group[i] = element, ...), or
+    until a nested group is modified. An element changed directly (or the list of
+    elements modified directly) is not seen until then: replace it with
+    group[i] = element to update the group.
     """
 
     def __init__(self, elements=None, label=""):
-        self.iteration = 0
         super(MatrixGroup, self).__init__(1, 0, 0, 1, label=label)
 
         self.elements = []
 
+        # Values calculated from the elements, kept only to accelerate the
+        # calculations: the cache is cleared every time the elements change.
+        self._cache = {}
+
         if elements is not None:
-            if not isinstance(elements, collections.Iterable):
+            try:
+                elements = iter(elements)
+            except TypeError:
                 raise TypeError("'elements' must be iterable (i.e. a list or a tuple of Matrix objects).")
 
             for element in elements:
@@ -82,6 +99,28 @@ class MatrixGroup(Matrix):
                     raise ValueError(msg)
 
         self.elements.append(matrix)
+        self._clearCache()
+        if type(matrix).mul_matrix is not Matrix.mul_matrix:
+            self._rebuild()
+            return
+
+        # The group is now matrix * group: we update it directly instead of
+        # recalculating the whole transferMatrix(), as in Matrix.mul_matrix()
+        if self.frontVertex is None and matrix.frontVertex is not None:
+            self.frontVertex = self.L + matrix.frontVertex
+        if matrix.backVertex is not None:
+            self.backVertex = self.L + matrix.backVertex
+
+        self.A, self.B, self.C, self.D = (matrix.A * self.A + matrix.B * self.C,
+                                          matrix.A * self.B + matrix.B * self.D,
+                                          matrix.C * self.A + matrix.D * self.C,
+                                          matrix.C * self.B + matrix.D * self.D)
+        self.L = matrix.L + self.L
+
+    def _rebuild(self):
+        """ Recalculate the ABCD matrix, the length and the vertices of the group
+        from all of its elements. """
+        self._clearCache()
         transferMatrix = self.transferMatrix()
         self.A = transferMatrix.A
         self.B = transferMatrix.B
@@ -91,6 +130,70 @@ class MatrixGroup(Matrix):
         self.frontVertex = transferMatrix.frontVertex
         self.backVertex = transferMatrix.backVertex
 
+    def _clearCache(self):
+        """ Forget the values calculated from the elements (including the last
+        ray trace), after the elements have changed. """
+        self._cache = {}
+        self._lastRayToBeTraced = None
+        self._lastRayTrace = None
+
+    def _validCache(self):
+        """ The cache of the values calculated from the elements, which is first
+        cleared if a nested group was modified since (i.e. it has a new cache). """
+        nestedCaches = self._cache.get('nestedCaches')
+        if nestedCaches is not None:
+            for group, cache in nestedCaches:
+                if group._validCache() is not cache:
+                    break
+            else:
+                return self._cache
+            self._clearCache()
+
+        self._cache['nestedCaches'] = [(element, element._validCache()) for element in self.elements
+                                       if isinstance(element, MatrixGroup)]
+        return self._cache
+
+    def _matchIndices(self, elements):
+        """ Check the indices between consecutive elements as append() does, and fix
+        those of a Space() that does not match. If another element does not match,
+        a ValueError is raised before anything is modified. """
+        spacesToFix = []
+        backIndex = None
+        for matrix in elements:
+            if backIndex is not None and backIndex != matrix.frontIndex:
+                if isinstance(matrix, Space):  # For Space(), we fix it
+                    spacesToFix.append((matrix, backIndex))
+                    continue
+                else:
+                    msg = "Mismatch of indices between last element and appended element"
+                    raise ValueError(msg)
+            backIndex = matrix.backIndex
+
+        for (space, index) in spacesToFix:
+            msg = "Fixing mismatched indices between last element and appended Space(). Use Space(d=someDistance, n=someIndex)."
+            warnings.warn(msg, UserWarning)
+            space.frontIndex = index
+            space.backIndex = index
+
+    def _replaceElements(self, start, stop, elements):
+        """ Replace the elements from start to stop - 1 by the new elements and
+        recalculate the group. The indices of the whole new list of elements are
+        checked before the list is modified, since a Space() that adopts a new index
+        must then be checked against the next element. """
+        self._matchIndices(self.elements[:start] + elements + self.elements[stop:])
+        self.elements[start:stop] = elements
+        self._rebuild()
+
+    def __eq__(self, other):
+        if isinstance(other, Matrix):
+            return self._uncachedAttributes(self) == self._uncachedAttributes(other)
+        return False
+
+    @staticmethod
+    def _uncachedAttributes(matrix):
+        # The values in _cache are only kept to accelerate the calculations
+        return {key: value for key, value in matrix.__dict__.items() if key != '_cache'}
+
     def __len__(self):
         """
         Returns the number of matrices in the group. Allows the use of len(MatrixGroup).
@@ -174,11 +277,9 @@ class MatrixGroup(Matrix):
         Has finite diameter? True
         Has finite diameter? False
         """
-        poppedElement = self.elements.pop(index)  # We pop the matrix in the list
-        tempElements = self.elements[:]  # We "copy" the list
-        self.elements.clear()  # We clear the attribute
-        for element in tempElements:
-            self.append(element)  # We rebuild the attribute (check indices, compute ABCD, etc)
+        index = range(len(self.elements))[index]  # Raises an IndexError as list.pop()
+        poppedElement = self.elements[index]
+        self._replaceElements(index, index + 1, [])
         return poppedElement
 
     def insert(self, index: int, element: Matrix):
@@ -216,15 +317,13 @@ class MatrixGroup(Matrix):
         --------
         raytracing.MatrixGroup.append
         """
-        if not isinstance(element, collections.Iterable):
+        # A MatrixGroup is a Matrix, but its elements are inserted instead of the group
+        if isinstance(element, Matrix) and not isinstance(element, MatrixGroup):
             element = MatrixGroup([element])
         else:
             element = MatrixGroup(element)
-        self.elements = self.elements[:index] + element.elements + self.elements[index:]
-        tempElements = self.elements[:]
-        self.elements.clear()
-        for matrix in tempElements:
-            self.append(matrix)
+        index = slice(index, None).indices(len(self.elements))[0]  # As list.insert()
+        self._replaceElements(index, index, element.elements)
 
     def __setitem__(self, key, element: Matrix):
         """ This function is used to substitute a single matrix 
@@ -262,15 +361,19 @@ class MatrixGroup(Matrix):
         if isinstance(key, slice):
             if key.step is not None and key.step != 1:
                 warnings.warn("Not using the step of the slice.", UserWarning)
-            if key.start is None:
-                key = slice(0, key.stop)
-            if key.stop is None:
-                key = slice(key.start, len(self))
-            self.elements = self.elements[:key.start] + self.elements[key.stop:]  # "Cut" the original list
-            self.insert(key.start, element)
+            (start, stop, step) = key.indices(len(self))
+            if stop < start:
+                stop = start
+        else:
+            start = range(len(self.elements))[key]  # Raises an IndexError as list.__setitem__()
+            stop = start + 1
+
+        # A MatrixGroup is a Matrix, but its elements are inserted instead of the group
+        if isinstance(element, Matrix) and not isinstance(element, MatrixGroup):
+            element = MatrixGroup([element])
         else:
-            self.pop(key)
-            self.insert(key, element)
+            element = MatrixGroup(element)
+        self._replaceElements(start, stop, element.elements)
 
     def transferMatrix(self, upTo=float('+Inf')):
         r""" The transfer matrix between front edge and distance=upTo
@@ -315,18 +418,196 @@ class MatrixGroup(Matrix):
         ray formalism.  To find out if a ray has been blocked, you must
         use trace().
         """
-        transferMatrix = Matrix(A=1, B=0, C=0, D=1)
-        distance = upTo
-        for element in self.elements:
-            if element.L <= distance:
-                transferMatrix = element * transferMatrix
-                distance -= element.L
-            else:
-                transferMatrix = element.transferMatrix(upTo=distance) * transferMatrix
-                break
+        arrays = self._elementArrays()
+        if not arrays['canMultiplyAsArrays']:
+            transferMatrix = Matrix(A=1, B=0, C=0, D=1)
+            distance = upTo
+            for element in self.elements:
+                if element.L <= distance:
+                    transferMatrix = element * transferMatrix
+                    distance -= element.L
+                else:
+                    transferMatrix = element.transferMatrix(upTo=distance) * transferMatrix
+                    break
+
+            return transferMatrix
+
+        # The complete elements are the first ones that end before upTo
+        cumulativeLengths = arrays['cumulativeLengths']
+        if arrays['hasOnlyPositiveLengths']:
+            k = int(np.searchsorted(cumulativeLengths, upTo, side='right'))
+        else:
+            isPastUpTo = cumulativeLengths > upTo
+            k = int(np.argmax(isPastUpTo)) if isPastUpTo.any() else len(cumulativeLengths)
+
+        L = 0.0
+        if k > 0:
+            L = float(cumulativeLengths[k - 1])
+
+        # Same product as element * transferMatrix for all complete elements,
+        # but without creating a Matrix() at every step.
+        a, b, c, d, frontElement, backElement = chain(*self._columns(arrays['soa'][:k], range(4)))
+
+        fIndex = 1.0
+        bIndex = 1.0
+        if frontElement >= 0:
+            fIndex = float(arrays['indices'][frontElement, 0])
+        if backElement >= 0:
+            bIndex = float(arrays['indices'][backElement, 1])
+
+        # Vertices are measured from the front edge, as in Matrix.mul_matrix()
+        fv = None
+        bv = None
+        frontVertexElements = arrays['frontVertexElements']
+        backVertexElements = arrays['backVertexElements']
+        if len(frontVertexElements) != 0 and frontVertexElements[0] < k:
+            i = frontVertexElements[0]
+            fv = self._lengthBefore(cumulativeLengths, i) + self.elements[i].frontVertex
+        numberOfBackVertices = bisect.bisect_left(backVertexElements, k)
+        if numberOfBackVertices != 0:
+            i = backVertexElements[numberOfBackVertices - 1]
+            bv = self._lengthBefore(cumulativeLengths, i) + self.elements[i].backVertex
+
+        transferMatrix = Matrix(float(a), float(b), float(c), float(d), frontVertex=fv, backVertex=bv,
+                                physicalLength=L, frontIndex=fIndex, backIndex=bIndex)
+        if k < len(self.elements):
+            transferMatrix = self.elements[k].transferMatrix(upTo=upTo - L) * transferMatrix
 
         return transferMatrix
 
+    @staticmethod
+    def _lengthBefore(cumulativeLengths, index):
+        if index == 0:
+            return 0.0
+        return float(cumulativeLengths[index - 1])
+
+    @staticmethod
+    def _packed(matrices):
+        """ The A, B, C, D and L values of the matrices, one row per matrix. """
+        return np.array([[matrix.A, matrix.B, matrix.C, matrix.D, matrix.L] for matrix in matrices],
+                        dtype=float).reshape((len(matrices), 5))
+
+    @staticmethod
+    def _columns(array, columns):
+        """ The columns of an array for the functions of _fast, which are faster
+        with Python lists when they are not compiled with Numba. """
+        if HAS_NUMBA:
+            return [array[:, column] for column in columns]
+        return [array[:, column].tolist() for column in columns]
+
+    def _elementArrays(self):
+        """ The values of all elements, kept in arrays for transferMatrix() and
+        intermediateConjugates() until the elements change: 'soa' has the A, B, C, D
+        and L values and 'indices' the front and back indices, one row per element. """
+        cache = self._validCache()
+        if 'elementArrays' in cache:
+            return cache['elementArrays']
+
+        values = np.array([[element.A, element.B, element.C, element.D, element.L,
+                            element.frontIndex, element.backIndex] for element in self.elements],
+                          dtype=float).reshape((len(self.elements), 7))
+        soa = values[:, :5].copy()
+        lengths = soa[:, 4]
+        arrays = {'soa': soa,
+                  'indices': values[:, 5:].copy(),
+                  'cumulativeLengths': np.cumsum(lengths),
+                  'hasOnlyPositiveLengths': bool(np.all(lengths >= 0)),
+                  'canMultiplyAsArrays': all([type(element).mul_matrix is Matrix.mul_matrix
+                                              for element in self.elements]),
+                  'hasNestedGroups': any([isinstance(element, MatrixGroup) for element in self.elements]),
+                  'frontVertexElements': [i for i, element in enumerate(self.elements)
+                                          if element.frontVertex is not None],
+                  'backVertexElements': [i for i, element in enumerate(self.elements)
+                                         if element.backVertex is not None]}
+        cache['elementArrays'] = arrays
+        return arrays
+
+    def compile(self, variableSpaces):
+        """ A function that calculates the ABCD matrix of the group for other
+        lengths of some of its Space() elements. All the other elements are
+        multiplied together only once, here, so the function only combines
+        these products with the lengths it receives. This is much faster than
+        transferMatrix() in optimization loops that only change a few distances.
+
+        Parameters
+        ----------
+        variableSpaces : list of Space
+            The elements of the group with a variable length. If the same Space()
+            object appears many times in the group, all of them have that length.
+
+        Returns
+        -------
+        transfer : function
+            transfer(d1, d2, ...) returns the (A, B, C, D) values of the group when
+            the lengths of the variableSpaces are d1, d2, ... (in the same order).
+
+        Examples
+        --------
+        >>> from raytracing import *
+        >>> space = Space(d=10)
+        >>> system = MatrixGroup([space, Lens(f=10), Space(d=10)])
+        >>> transfer = system.compile([space])
+        >>> print(transfer(20))
+        (0.0, 10.0, -0.1, -1.0)
+
+        Notes
+        -----
+        The function is kept until the elements of the group change. Its results are
+        those of transferMatrix() once the lengths are changed, up to rounding errors,
+        because the elements between the variable spaces are multiplied first.
+        """
+        key = tuple([id(space) for space in variableSpaces])
+        compiledTransfers = self._validCache().setdefault('compiledTransfers', {})
+        if key in compiledTransfers:
+            return compiledTransfers[key]
+
+        for space in variableSpaces:
+            if not isinstance(space, Space) or not any([element is space for element in self.elements]):
+                raise ValueError("The variable elements must be Space() elements of the group.")
+
+        # The product of the fixed elements before each variable space, and after the last one
+        steps = []
+        fixedProduct = Matrix(A=1, B=0, C=0, D=1)
+        for element in self.elements:
+            parameters = [i for i, space in enumerate(variableSpaces) if element is space]
+            if len(parameters) != 0:
+                steps.append((fixedProduct.A, fixedProduct.B, fixedProduct.C, fixedProduct.D, parameters[0]))
+                fixedProduct = Matrix(A=1, B=0, C=0, D=1)
+            else:
+                fixedProduct = element * fixedProduct
+        (lastA, lastB, lastC, lastD) = (fixedProduct.A, fixedProduct.B, fixedProduct.C, fixedProduct.D)
+        numberOfLengths = len(variableSpaces)
+
+        def transfer(*lengths):
+            if len(lengths) != numberOfLengths:
+                raise TypeError(f"Expected {numberOfLengths} lengths, got {len(lengths)}.")
+
+            a, b, c, d = 1.0, 0.0, 0.0, 1.0
+            for (A, B, C, D, parameter) in steps:
+                a, b, c, d = A * a + B * c, A * b + B * d, C * a + D * c, C * b + D * d
+                length = lengths[parameter]
+                a, b = a + length * c, b + length * d  # The Space() of that length
+
+            return (lastA * a + lastB * c, lastA * b + lastB * d,
+                    lastC * a + lastD * c, lastC * b + lastD * d)
+
+        compiledTransfers[key] = transfer
+        return transfer
+
+    def __getstate__(self):
+        """ The cache is left out of the saved state: it is calculated again when
+        needed, and the functions of compile() are local functions that cannot
+        be pickled. """
+        state = self.__dict__.copy()
+        state['_cache'] = {}
+        return state
+
+    def __setstate__(self, state):
+        """ A group saved before the cache was added (i.e. without _cache)
+        starts with an empty cache. """
+        self.__dict__.update(state)
+        self._cache = {}
+
     def transferMatrices(self):
         r""" The list of Matrix() that corresponds to the propagation through
         this element (or group). For a Matrix(), it simply returns a list 
@@ -362,12 +643,12 @@ class MatrixGroup(Matrix):
         f=10.000
 
         """
+        cache = self._validCache()
+        if 'transferMatrices' not in cache:
+            transferMatrices = itertools.chain.from_iterable(element.transferMatrices() for element in self.elements)
+            cache['transferMatrices'] = list(transferMatrices)
 
-        transferMatrices = []
-        for element in self.elements:
-            elementTransferMatrices = element.transferMatrices()
-            transferMatrices.extend(elementTransferMatrices)
-        return transferMatrices
+        return list(cache['transferMatrices'])
 
     def intermediateConjugates(self):
         """ This function calculates the position and the magnification of the conjugate planes.
@@ -392,20 +673,53 @@ class MatrixGroup(Matrix):
         [[90.0, -2.0]]
 
         """
-        transferMatrix = Matrix(A=1, B=0, C=0, D=1)
-        matrices = self.transferMatrices()
+        arrays = self._elementArrays()
+        if arrays['hasNestedGroups']:
+            matrices = self.transferMatrices()
+            canMultiplyAsArrays = all([type(element).mul_matrix is Matrix.mul_matrix for element in matrices])
+        else:
+            matrices = self.elements
+            canMultiplyAsArrays = arrays['canMultiplyAsArrays']
+
         planes = []
-        for element in matrices:
-            transferMatrix = element * transferMatrix
-            (distance, conjugate) = transferMatrix.forwardConjugate()
-            if distance is not None:
-                planePosition = transferMatrix.L + distance
-                if planePosition != 0 and conjugate is not None:
-                    magnification = conjugate.A
-                    if any([areAbsolutelyAlmostEqual(pos, planePosition) and areAbsolutelyAlmostEqual(mag, magnification) for pos, mag in planes]):
-                        continue
-                    else:
-                        planes.append([planePosition, magnification])
+        if not canMultiplyAsArrays:
+            transferMatrix = Matrix(A=1, B=0, C=0, D=1)
+            for element in matrices:
+                transferMatrix = element * transferMatrix
+                (distance, conjugate) = transferMatrix.forwardConjugate()
+                if distance is not None:
+                    planePosition = transferMatrix.L + distance
+                    if planePosition != 0 and conjugate is not None:
+                        magnification = conjugate.A
+                        if any([areAbsolutelyAlmostEqual(pos, planePosition) and areAbsolutelyAlmostEqual(mag, magnification) for pos, mag in planes]):
+                            continue
+                        else:
+                            planes.append([planePosition, magnification])
+            return planes
+
+        # The transfer matrix after each element, all at once. For each of them,
+        # the conjugate is calculated as in forwardConjugate(): it requires D != 0.
+        if arrays['hasNestedGroups']:
+            soa = self._packed(matrices)
+            lengths = np.cumsum(soa[:, 4])
+        else:
+            soa = arrays['soa']
+            lengths = arrays['cumulativeLengths']
+        a, b, c, d = prefixProducts(*self._columns(soa, range(4)))
+
+        hasConjugate = d != 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distances = -b / d
+            planePositions = lengths + distances
+            magnifications = a + distances * c
+        hasConjugate &= planePositions != 0
+
+        for planePosition, magnification in zip(planePositions[hasConjugate].tolist(),
+                                                magnifications[hasConjugate].tolist()):
+            if any([areAbsolutelyAlmostEqual(pos, planePosition) and areAbsolutelyAlmostEqual(mag, magnification) for pos, mag in planes]):
+                continue
+            else:
+                planes.append([planePosition, magnification])
         return planes
 
     def trace(self, inputRay):
@@ -437,12 +751,22 @@ class MatrixGroup(Matrix):
         if not isinstance(inputRay, (Ray, GaussianBeam)):
             raise TypeError("'inputRay' must be a Ray or a GaussianBeam.")
         ray = inputRay
-        if ray != self._lastRayToBeTraced:
-            rayTrace = [ray]
+        self._validCache()  # Forgets the last ray trace if a nested group was modified
+        # The same Ray() object is the most common case, and the fastest to check
+        isLastRay = ray is self._lastRayToBeTraced or (self._lastRayToBeTraced is not None
+                                                      and ray == self._lastRayToBeTraced)
+        if not isLastRay:
+            # The list is allocated once. The length is exact for a Ray(), and
+            # the slices adjust if an element returns another number of rays.
+            rayTrace = [None] * self.traceLength
+            rayTrace[0] = ray
+            i = 1
             for element in self.elements:
                 rayTraceInElement = element.trace(ray)
-                rayTrace.extend(rayTraceInElement)
+                rayTrace[i:i + element.traceLength] = rayTraceInElement
+                i += len(rayTraceInElement)
                 ray = rayTraceInElement[-1]  # last
+            del rayTrace[i:]
             self._lastRayToBeTraced = inputRay
             self._lastRayTrace = rayTrace
         else:
@@ -450,27 +774,162 @@ class MatrixGroup(Matrix):
 
         return rayTrace
 
+    @property
+    def traceLength(self):
+        """ The number of rays in the ray trace of a Ray() with trace():
+        the input ray, followed by the ray trace in each element.
+
+        Returns
+        -------
+        traceLength : int
+            The number of rays returned by trace(ray)
+        """
+        cache = self._validCache()
+        if 'traceLength' not in cache:
+            traceLength = 1
+            for element in self.elements:
+                traceLength += element.traceLength
+            cache['traceLength'] = traceLength
+
+        return cache['traceLength']
+
+    def canTraceAsArrays(self):
+        """ True if all elements only use the ABCD formalism to trace rays
+        (i.e. they do not override trace() or mul_ray()), which means
+        traceAsArrays() gives the same ray traces as trace(). """
+        if type(self).trace is not MatrixGroup.trace:
+            return False
+
+        for element in self._tracedElements():
+            if element is None:
+                continue
+            if isinstance(element, MatrixGroup):
+                if type(element).trace is not MatrixGroup.trace:
+                    return False
+            elif type(element).trace is not Matrix.trace or type(element).mul_ray is not Matrix.mul_ray:
+                return False
+        return True
+
+    def _tracedElements(self):
+        """ The elements in the order they are traced by trace(). Each group
+        is followed by None, where its own trace starts again with its input ray,
+        and then by its elements. """
+        for element in self.elements:
+            yield element
+            if isinstance(element, MatrixGroup):
+                yield None
+                yield from element._tracedElements()
+
+    def traceAsArrays(self, inputRays):
+        """ Trace many rays at once through the group, with arrays: each element
+        propagates all the rays in a single operation instead of one Ray() at a time.
+
+        Parameters
+        ----------
+        inputRays : list of Ray
+            The rays to trace
+
+        Returns
+        -------
+        z, y, theta : arrays of floats
+            The position, height and angle of each ray (first axis) at each point
+            of its ray trace (second axis), as in trace().
+        isBlocked : array of bool
+            If the ray is blocked at each point of its ray trace
+
+        See Also
+        --------
+        raytracing.MatrixGroup.trace
+        raytracing.MatrixGroup.canTraceAsArrays
+
+        Notes
+        -----
+        The ray traces are the same as those of trace() only if canTraceAsArrays()
+        is True. As with trace(), blocked rays are not propagated any further, and
+        an element of finite length adds the ray at its
+        entrance and blocks it there if it is outside the aperture. Since that
+        entrance ray is the same object as the last rays of the trace, all of them
+        are marked as blocked.
+        """
+        z = np.array([ray.z for ray in inputRays], dtype=float)
+        y = np.array([ray.y for ray in inputRays], dtype=float)
+        theta = np.array([ray.theta for ray in inputRays], dtype=float)
+        isBlocked = np.array([ray.isBlocked for ray in inputRays], dtype=bool)
+
+        zs = [z]
+        ys = [y]
+        thetas = [theta]
+        blocked = [isBlocked]
+        sameRayStart = 0  # First point of the trace that is the current Ray() object
+        for element in self._tracedElements():
+            if element is None:
+                zs.append(z)
+                ys.append(y)
+                thetas.append(theta)
+                blocked.append(isBlocked)
+                continue
+            elif isinstance(element, MatrixGroup):
+                continue
+
+            isOutside = np.abs(y) > abs(element.apertureDiameter / 2.0)
+            if element.L > 0:
+                isBlocked = isBlocked | isOutside
+                for i in range(sameRayStart, len(blocked)):
+                    blocked[i] = blocked[i] | isBlocked
+                zs.append(z)
+                ys.append(y)
+                thetas.append(theta)
+                blocked.append(isBlocked)
+
+            # As in mul_ray(), a blocked ray is not propagated any further
+            isPropagated = ~isBlocked
+            isBlocked = isBlocked | isOutside
+            y, theta = (np.where(isPropagated, element.A * y + element.B * theta, y),
+                        np.where(isPropagated, element.C * y + element.D * theta, theta))
+            z = np.where(isPropagated, element.L + z, z)
+            sameRayStart = len(blocked)
+            zs.append(z)
+            ys.append(y)
+            thetas.append(theta)
+            blocked.append(isBlocked)
+
+        return (np.stack(zs, axis=1), np.stack(ys, axis=1),
+                np.stack(thetas, axis=1), np.stack(blocked, axis=1))
+
     def hasFiniteApertureDiameter(self):
         """ True if ImagingPath has at least one element of finite diameter """
-        for element in self.elements:
-            if element.hasFiniteApertureDiameter():
-                return True
-        return False
+        (hasFiniteDiameter, maxFiniteDiameter) = self._apertureDiameters()
+        return hasFiniteDiameter
+
+    def _apertureDiameters(self):
+        """ If any element has a finite diameter and the largest finite
+        diameter of the elements, obtained in a single pass and kept until
+        the group is modified (an element changed directly must be replaced
+        with group[i] = element, see MatrixGroup). """
+        cache = self._validCache()
+        if 'apertureDiameters' not in cache:
+            hasFiniteDiameter = False
+            maxFiniteDiameter = 0
+            for element in self.elements:
+                if element.hasFiniteApertureDiameter():
+                    hasFiniteDiameter = True
+                diameter = element.largestDiameter
+                if diameter != float('+Inf') and diameter > maxFiniteDiameter:
+                    maxFiniteDiameter = diameter
+            cache['apertureDiameters'] = (hasFiniteDiameter, maxFiniteDiameter)
+
+        return cache['apertureDiameters']
 
     @property
     def largestDiameter(self):
         """ Largest finite diameter in all elements """
 
-        maxDiameter = 0
-        if self.hasFiniteApertureDiameter():
-            for element in self.elements:
-                diameter = element.largestDiameter
-                if diameter != float('+Inf') and diameter > maxDiameter:
-                    maxDiameter = diameter
-        elif len(self.elements) != 0:
-            maxDiameter = self.elements[0].displayHalfHeight() * 2
-        else:
-            maxDiameter = float("+inf")
+        (hasFiniteDiameter, maxDiameter) = self._apertureDiameters()
+        if not hasFiniteDiameter:
+            if len(self.elements) != 0:
+                maxDiameter = self.elements[0].displayHalfHeight() * 2
+            else:
+                maxDiameter = float("+inf")
 
         return maxDiameter
 
@@ -478,28 +937,16 @@ class MatrixGroup(Matrix):
         """ Flip the orientation (forward-backward) of this group of elements.
         Each element is also flipped individually. """
 
-        allElements = self.elements
-        allElements.reverse()
-        self.elements = []
-
-        for element in allElements:
+        for element in self.elements:
             element.flipOrientation()
-            self.append(element)
+        self.elements.reverse()
+        self._matchIndices(self.elements)
+        self._rebuild()
 
         return self
 
     def __iter__(self):
-        self.iteration = 0
-        return self
-
-    def __next__(self):
-        if self.elements is None:
-            raise StopIteration
-        if self.iteration < len(self.elements):
-            element = self.elements[self.iteration]
-            self.iteration += 1
-            return element
-        raise StopIteration
+        return iter(self.elements)
 
     def save(self, filePath: str):
 
@@ -512,29 +959,12 @@ class MatrixGroup(Matrix):
             Must be provided in OS-dependent format.
         """
         with open(filePath, "wb") as outfile:
-            pickle.Pickler(outfile).dump(self.elements)
-
-            # We save the data to disk using a module called Pickler
-            # Some asynchronous magic is happening here with Pickle
-            # and sometimes, access to files is wonky, especially
-            # when the files are very large.
-            # Make sure file exists
-            while not os.path.exists(filePath):
-                time.sleep(0.1)
-
-            oldSize = None
-            # Make sure file is not still being written to
-            while True:
-                try:
-                    currentSize = os.path.getsize(filePath)
-                    if currentSize == oldSize:
-                        break
-
-                    time.sleep(1)
-                    oldSize = currentSize
-                except:
-                    # Not possible, yet: sometimes we get here
-                    time.sleep(0.1)
+            pickle.dump(self.elements, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # Pickle writes synchronously: we only make sure the data
+            # is on disk when we return.
+            outfile.flush()
+            os.fsync(outfile.fileno())
 
     def load(self, filePath, append=False):
         """ A MatrixGroup saved with `save()` can be loaded using this function.
@@ -549,7 +979,7 @@ class MatrixGroup(Matrix):
         """
 
         with open(filePath, 'rb') as infile:
-            loadedMatrices = pickle.Unpickler(infile).load()
+            loadedMatrices = pickle.load(infile)
             if not isinstance(loadedMatrices, collections.Iterable):
                 raise IOError(f"{filePath} does not contain an iterable of Matrix objects.")
             if not all([isinstance(matrix, Matrix) for matrix in loadedMatrices]):
@@ -559,5 +989,6 @@ class MatrixGroup(Matrix):
                     self.append(element)
             else:
                 self.elements = []
+                self._rebuild()
                 for element in loadedMatrices:
                     self.append(element)
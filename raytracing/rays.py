@@ -414,7 +414,7 @@ class Rays:
         """
 
         with open(filePath, 'rb') as infile:
-            loadedRays = pickle.Unpickler(infile).load()
+            loadedRays = pickle.load(infile)
             if not isinstance(loadedRays, collections.Iterable):
                 raise IOError(f"{filePath} does not contain an iterable of Ray objects.")
             if not all([isinstance(ray, Ray) for ray in loadedRays]):
@@ -436,29 +436,12 @@ class Rays:
         """
 
         with open(filePath, 'wb') as outfile:
-            pickle.Pickler(outfile).dump(self._rays)
-
-        # We save the data to disk using a module called Pickler
-        # Some asynchronous magic is happening here with Pickle
-        # and sometimes, access to files is wonky, especially
-        # when the files are very large.
-        # Make sure file exists
-        while not os.path.exists(filePath):
-            time.sleep(0.1)
-
-        oldSize = None
-        # Make sure file is not still being written to
-        while True:
-            try:
-                currentSize = os.path.getsize(filePath)
-                if currentSize == oldSize:
-                    break
-
-                time.sleep(1)
-                oldSize = currentSize
-            except:
-                # Not possible, yet: sometimes we get here
-                time.sleep(0.1)
+            pickle.dump(self._rays, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # Pickle writes synchronously: we only make sure the data
+            # is on disk when we return.
+            outfile.flush()
+            os.fsync(outfile.fileno())
 
     # For 2D histogram:
     # https://en.wikipedia.org/wiki/Xiaolin_Wu's_line_algorithm
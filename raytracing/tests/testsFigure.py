@@ -67,6 +67,29 @@ class TestFigure(unittest.TestCase):
 
         self.assertTupleEqual(xy, (z, x))
 
+    def testRayTraceCoordinatesSameAsRearrangedRayTrace(self):
+        path = ImagingPath([Space(10), Lens(5, 20), Space(10), Aperture(15), Space(5)])
+        rays = [Ray(0, 1), Ray(0, 1.01), Ray(5, -0.5), Ray(-8, 0.2)]
+        self.assertTrue(path.figure.canTraceAsArrays())
+
+        for removeBlocked in [True, False]:
+            manyCoordinates = path.figure.rayTraceCoordinates(rays, removeBlocked)
+            for ray, (z, x) in zip(rays, manyCoordinates):
+                zExpected, xExpected = path.figure.rearrangeRayTraceForPlotting(path.trace(ray), removeBlocked)
+                self.assertListEqual(list(z), zExpected)
+                self.assertListEqual(list(x), xExpected)
+
+    def testCreateFigureReusesFigure(self):
+        figure = Figure(ImagingPath())
+        figure.createFigure(comments="Some comments")
+        matplotlibFigure = figure.figure
+        self.assertEqual(len(matplotlibFigure.axes), 2)
+
+        figure.createFigure(figure=matplotlibFigure)
+        self.assertIs(figure.figure, matplotlibFigure)
+        self.assertEqual(len(matplotlibFigure.axes), 1)
+        self.assertIs(figure.axes, matplotlibFigure.axes[0])
+
 
 class TestFigureAxesToDataScale(unittest.TestCase):
     def testWithEmptyImagingPath(self):
@@ -157,6 +157,52 @@ class TestImagingPath(envtest.RaytracingTestCase):
         imgSize = 2 * 10 / 3 * 2
         self.assertAlmostEqual(path.imageSize(), imgSize, 2)
 
+    def testFieldStopRecalculatedAfterAppend(self):
+        path = ImagingPath([Space(10), Lens(10, 100), Space(20), Lens(10, 50)])
+        self.assertIs(path.fieldStop(), path.fieldStop())
+
+        path.append(Space(10))
+        path.append(Aperture(10))
+        self.assertTupleEqual(path.fieldStop(), (40, 10))
+
+    def testFieldStopRecalculatedAfterPop(self):
+        path = ImagingPath([Space(10), Lens(10, 100), Space(20), Lens(10, 50), Space(10), Aperture(10)])
+        self.assertTupleEqual(path.fieldStop(), (40, 10))
+
+        path.pop(-1)
+        self.assertTupleEqual(path.fieldStop(), ImagingPath(path.elements).fieldStop())
+
+    def testFieldStopRecalculatedAfterNestedGroupModification(self):
+        group = MatrixGroup([Space(10), Lens(10, 100), Space(20), Lens(10, 50)])
+        path = ImagingPath([group])
+        fieldStop = path.fieldStop()
+
+        group.append(Space(10))
+        group.append(Aperture(10))
+        self.assertNotEqual(path.fieldStop(), fieldStop)
+        self.assertTupleEqual(path.fieldStop(), ImagingPath(group.elements).fieldStop())
+
+    def testFieldStopRecalculatedWithNewPrecision(self):
+        path = ImagingPath([Space(10), Lens(10, 100), Space(20), Lens(10, 50), Space(10)])
+        fieldStop = path.fieldStop()
+        path.precision = 0.01
+        self.assertIsNot(path.fieldStop(), fieldStop)
+        self.assertTupleEqual(path.fieldStop(), fieldStop)
+
+    def testIntermediateConjugatesRecalculatedAfterFlipOrientation(self):
+        space = Space(10)
+        path = ImagingPath([space, ThickLens(1.5, 10, -40, 4, diameter=20), space])
+        path.intermediateConjugates()
+
+        path.flipOrientation()
+        self.assertListEqual(path.intermediateConjugates(), ImagingPath(path.elements).intermediateConjugates())
+
+    def testIntermediateConjugatesNotModifiedByCaller(self):
+        path = ImagingPath(System4f(f1=10, f2=20))
+        conjugates = path.intermediateConjugates()
+        conjugates.append([0, 1])
+        self.assertListEqual(path.intermediateConjugates(), MatrixGroup(path.elements).intermediateConjugates())
+
     def testSave(self):
         filename = self.tempFilePath("test.png")
         comments = "This is a test"
@@ -1,4 +1,5 @@
 import envtest  # modifies path
+from unittest.mock import patch
 
 from raytracing import *
 
@@ -92,6 +93,73 @@ class TestMatrixGroup(envtest.RaytracingTestCase):
         self.assertEqual(transferMatrix.backVertex, supposedTransfer.backVertex)
         self.assertEqual(transferMatrix.L, supposedTransfer.L)
 
+    def testTransferMatrixSameAsProductOfElements(self):
+        elements = [Space(2), Matrix(), DielectricInterface(1, 1.5, 10), Space(3, n=1.5),
+                    DielectricInterface(1.5, 1, -10), Space(4), Lens(5), Space(0)]
+        mg = MatrixGroup(elements)
+        transferMatrix = mg.transferMatrix()
+        supposedTransfer = Matrix()
+        for element in elements:
+            supposedTransfer = element * supposedTransfer
+
+        self.assertEqual(transferMatrix.A, supposedTransfer.A)
+        self.assertEqual(transferMatrix.B, supposedTransfer.B)
+        self.assertEqual(transferMatrix.C, supposedTransfer.C)
+        self.assertEqual(transferMatrix.D, supposedTransfer.D)
+        self.assertEqual(transferMatrix.frontIndex, supposedTransfer.frontIndex)
+        self.assertEqual(transferMatrix.backIndex, supposedTransfer.backIndex)
+        self.assertEqual(transferMatrix.frontVertex, supposedTransfer.frontVertex)
+        self.assertEqual(transferMatrix.backVertex, supposedTransfer.backVertex)
+        self.assertEqual(transferMatrix.L, supposedTransfer.L)
+
+    def testTransferMatrixUpToEachElement(self):
+        elements = [Space(2), Lens(5), Space(4), Lens(10), Aperture(3), Space(8)]
+        mg = MatrixGroup(elements)
+
+        # Elements of null length at upTo are included
+        supposedTransfers = {2: Lens(5) * Space(2),
+                             6: Aperture(3) * Lens(10) * Space(4) * Lens(5) * Space(2),
+                             9: Space(3) * Aperture(3) * Lens(10) * Space(4) * Lens(5) * Space(2),
+                             14: Space(8) * Aperture(3) * Lens(10) * Space(4) * Lens(5) * Space(2)}
+        for upTo, supposedTransfer in supposedTransfers.items():
+            transferMatrix = mg.transferMatrix(upTo=upTo)
+            self.assertEqual(transferMatrix.L, supposedTransfer.L)
+            self.assertAlmostEqual(transferMatrix.A, supposedTransfer.A)
+            self.assertAlmostEqual(transferMatrix.B, supposedTransfer.B)
+            self.assertAlmostEqual(transferMatrix.C, supposedTransfer.C)
+            self.assertAlmostEqual(transferMatrix.D, supposedTransfer.D)
+
+    def testTransferMatrixUpdatedAfterNestedGroupModification(self):
+        child = MatrixGroup([Space(10)])
+        mg = MatrixGroup([child, Lens(10)])
+        self.assertEqual(mg.transferMatrix().B, 10)
+
+        child.append(Space(10))
+        self.assertEqual(mg.transferMatrix().B, 20)
+
+    def testCompiledTransferSameAsTransferMatrix(self):
+        space1 = Space(10)
+        space2 = Space(5)
+        mg = MatrixGroup([space1, Lens(10), space2, ThickLens(1.5, 20, -20, 5), space1, Lens(-30)])
+        transfer = mg.compile([space2, space1])
+        self.assertIs(mg.compile([space2, space1]), transfer)
+
+        for (d1, d2) in [(10, 5), (20, 3.5), (0, 40)]:
+            expected = MatrixGroup([Space(d1), Lens(10), Space(d2), ThickLens(1.5, 20, -20, 5), Space(d1),
+                                    Lens(-30)]).transferMatrix()
+            (A, B, C, D) = transfer(d2, d1)
+            self.assertAlmostEqual(A, expected.A)
+            self.assertAlmostEqual(B, expected.B)
+            self.assertAlmostEqual(C, expected.C)
+            self.assertAlmostEqual(D, expected.D)
+
+    def testCompiledTransferWithOtherElements(self):
+        mg = MatrixGroup([Space(10), Lens(10)])
+        with self.assertRaises(ValueError):
+            mg.compile([Space(10)])
+        with self.assertRaises(ValueError):
+            mg.compile([mg.elements[1]])
+
     def testAppendNoElementInit(self):
         mg = MatrixGroup()
         element = DielectricInterface(1.33, 1, 10)
@@ -115,6 +183,21 @@ class TestMatrixGroup(envtest.RaytracingTestCase):
         self.assertEqual(mg.C, transferMat.C)
         self.assertEqual(mg.D, transferMat.D)
 
+    def testAppendSameAsTransferMatrix(self):
+        mg = MatrixGroup([Space(10), Lens(5), Space(2), ThickLens(1.5, 10, -10, 3), Space(8)])
+        mg.pop(0)
+        mg.append(DielectricSlab(1.5, 4))
+        transferMatrix = mg.transferMatrix()
+        self.assertEqual(mg.A, transferMatrix.A)
+        self.assertEqual(mg.B, transferMatrix.B)
+        self.assertEqual(mg.C, transferMatrix.C)
+        self.assertEqual(mg.D, transferMatrix.D)
+        self.assertEqual(mg.L, transferMatrix.L)
+        self.assertEqual(mg.frontVertex, transferMatrix.frontVertex)
+        self.assertEqual(mg.backVertex, transferMatrix.backVertex)
+        self.assertEqual(mg.frontVertex, 0)
+        self.assertEqual(mg.backVertex, 17)
+
     def testAppendNoRefractionIndicesMismatch(self):
         mg = MatrixGroup()
         element = DielectricInterface(1, 1.33, 10)
@@ -200,6 +283,22 @@ class TestMatrixGroup(envtest.RaytracingTestCase):
         self.assertEqual(len(transferMatrices), 2)
         self.assertListEqual(transferMatrices, [element1, element2])
 
+    def testTransferMatricesUpdatedAfterModification(self):
+        element1 = Space(10)
+        element2 = Lens(2)
+        element3 = Space(5)
+        mg = MatrixGroup([element1, element2])
+        self.assertListEqual(mg.transferMatrices(), [element1, element2])
+
+        mg.insert(1, element3)
+        self.assertListEqual(mg.transferMatrices(), [element1, element3, element2])
+        mg.pop(0)
+        self.assertListEqual(mg.transferMatrices(), [element3, element2])
+
+        transferMatrices = mg.transferMatrices()
+        transferMatrices.append(element1)
+        self.assertListEqual(mg.transferMatrices(), [element3, element2])
+
     def testTraceEmptyMatrixGroup(self):
         mg = MatrixGroup()
         ray = Ray(10, 10)
@@ -236,6 +335,56 @@ class TestMatrixGroup(envtest.RaytracingTestCase):
         self.assertEqual(mg._lastRayToBeTraced, trace[0])
         self.assertTrue(mgTrace2[-1].isBlocked)
 
+    def testTraceSameAsTraceOfEachElement(self):
+        elements = [Space(10), Lens(5, 22), Space(10, diameter=10), Aperture(15), Space(5)]
+        for inputRay in [Ray(0, 1), Ray(0, 1.01), Ray(2, -0.5), Ray(-8, 0.2)]:
+            ray = Ray(inputRay.y, inputRay.theta)
+            expectedTrace = [ray]
+            for element in elements:
+                rayTraceInElement = element.trace(ray)
+                expectedTrace.extend(rayTraceInElement)
+                ray = rayTraceInElement[-1]
+
+            rayTrace = MatrixGroup(elements).trace(inputRay)
+            self.assertIs(rayTrace[0], inputRay)
+            self.assertEqual(len(rayTrace), len(expectedTrace))
+            for ray, expectedRay in zip(rayTrace, expectedTrace):
+                self.assertEqual(ray, expectedRay)
+                self.assertEqual(ray.z, expectedRay.z)
+                self.assertEqual(ray.isBlocked, expectedRay.isBlocked)
+                self.assertEqual(ray.apertureDiameter, expectedRay.apertureDiameter)
+
+    def testTraceAsArraysSameAsTrace(self):
+        mg = MatrixGroup([Space(10), Lens(5, 20), MatrixGroup([Space(10), Aperture(15)]), Space(5, diameter=10)])
+        rays = [Ray(0, 1), Ray(0, 1.01), Ray(5, -0.5), Ray(-8, 0.2)]
+        self.assertTrue(mg.canTraceAsArrays())
+
+        (z, y, theta, isBlocked) = mg.traceAsArrays(rays)
+        for i, ray in enumerate(rays):
+            rayTrace = mg.trace(ray)
+            self.assertListEqual(list(z[i]), [r.z for r in rayTrace])
+            self.assertListEqual(list(y[i]), [r.y for r in rayTrace])
+            self.assertListEqual(list(theta[i]), [r.theta for r in rayTrace])
+            self.assertListEqual(list(isBlocked[i]), [r.isBlocked for r in rayTrace])
+
+    def testTraceRecalculatedAfterAppend(self):
+        ray = Ray(2, 2)
+        mg = MatrixGroup([Space(2)])
+        self.assertIs(mg.trace(ray), mg.trace(ray))
+
+        mg.append(Space(3))
+        self.assertEqual(len(mg.trace(ray)), 5)
+        self.assertEqual(mg.trace(ray)[-1].z, 5)
+
+    def testTraceLength(self):
+        mg = MatrixGroup([Space(10), Lens(10), MatrixGroup([Space(5), Aperture(10)])])
+        self.assertEqual(mg.traceLength, 1 + 2 + 1 + (1 + 2 + 1))
+        self.assertEqual(len(mg.trace(Ray(1, 0.1))), mg.traceLength)
+
+        rayTrace = mg.trace(GaussianBeam(w=1, wavelength=0.5))
+        self.assertEqual(len(rayTrace), 1 + 1 + 1 + (1 + 1 + 1))
+        self.assertNotIn(None, rayTrace)
+
     def testTraceIncorrectType(self):
         s = Space(2, diameter=5)
         l = Lens(6, diameter=5)
@@ -271,6 +420,19 @@ class TestMatrixGroup(envtest.RaytracingTestCase):
         intermediateConj = mg.intermediateConjugates()
         self.assertListEqual(intermediateConj, [[30.0, -0.5]])
 
+    def testIntermediateConjugatesSameAsForwardConjugates(self):
+        elements = [Space(10), Lens(10), Space(15), Lens(5), Space(5), ThickLens(1.5, 20, -20, 5), Space(40)]
+        mg = MatrixGroup(elements)
+        planes = []
+        for i in range(1, len(elements) + 1):
+            transferMatrix = MatrixGroup(elements[:i]).transferMatrix()
+            (distance, conjugate) = transferMatrix.forwardConjugate()
+            if conjugate is not None:
+                planes.append([transferMatrix.L + distance, conjugate.A])
+
+        for plane in mg.intermediateConjugates():
+            self.assertIn(plane, planes)
+
     def testHasFiniteApertutreDiameter(self):
         space = Space(10, 1.2541255)
         mg = MatrixGroup([space])
@@ -289,6 +451,26 @@ class TestMatrixGroup(envtest.RaytracingTestCase):
         mg = MatrixGroup([Space(10), Lens(5)])
         self.assertEqual(mg.largestDiameter, 8)
 
+    def testLargestDiameterUpdatedAfterModification(self):
+        mg = MatrixGroup([Space(14, diameter=10), Lens(5)])
+        self.assertEqual(mg.largestDiameter, 10)
+
+        mg.append(Space(5, diameter=25))
+        self.assertEqual(mg.largestDiameter, 25)
+        mg.pop(0)
+        mg.pop(-1)
+        self.assertFalse(mg.hasFiniteApertureDiameter())
+        self.assertEqual(mg.largestDiameter, 8)
+
+    def testLargestDiameterUpdatedAfterElementReplaced(self):
+        lens = Lens(f=10, diameter=10)
+        mg = MatrixGroup([Space(10), lens, Space(10)])
+        self.assertEqual(mg.largestDiameter, 10)
+
+        lens.apertureDiameter = 50
+        mg[1] = lens
+        self.assertEqual(mg.largestDiameter, 50)
+
     def testLargestDiameterWithEmptyGroup(self):
         m = MatrixGroup()
         self.assertEqual(m.largestDiameter, float("+inf"))
@@ -450,6 +632,47 @@ class TestMatrixGroup(envtest.RaytracingTestCase):
         mg.insert(1, lens10)
         self.assertListEqual(mg.elements, [space10, lens10, space10])
 
+    def testNestedIterations(self):
+        elements = [Space(10), Lens(10), Space(10)]
+        mg = MatrixGroup(elements)
+        pairs = [(element1, element2) for element1 in mg for element2 in mg]
+        self.assertEqual(len(pairs), 9)
+        self.assertListEqual(list(mg), elements)
+
+    def testInsertMatrixGroup(self):
+        space10 = Space(10)
+        lens10 = Lens(10)
+        mg = MatrixGroup([space10, space10])
+        mg.insert(1, MatrixGroup([lens10, space10, lens10]))
+        self.assertListEqual(mg.elements, [space10, lens10, space10, lens10, space10])
+
+    def testInsertSameAsAppend(self):
+        elements = [Space(10), Lens(10), Space(20), Lens(20), Space(20)]
+        mg = MatrixGroup(elements[:2])
+        mg.insert(2, elements[2:])
+        self.assertEqual(mg, MatrixGroup(elements))
+
+    def testInsertMismatchedIndices(self):
+        elements = [Space(10), Lens(10), Space(10)]
+        mg = MatrixGroup(elements)
+        with self.assertRaises(ValueError):
+            mg.insert(1, DielectricInterface(1.33, 1, 10))
+        self.assertListEqual(mg.elements, elements)
+        self.assertEqual(mg, MatrixGroup(elements))
+
+        elements = [Lens(f=5), Space(d=2), Aperture(5)]
+        mg = MatrixGroup(elements)
+        with self.assertRaises(ValueError):
+            mg.insert(1, DielectricInterface(n1=1, n2=1.5))
+        self.assertListEqual(mg.elements, elements)
+        self.assertEqual(mg.elements[1].backIndex, 1)
+
+        mg = MatrixGroup([DielectricInterface(1, 1.33, 10), Space(10, 1.33)])
+        with self.assertWarns(UserWarning):
+            mg.insert(1, Space(5))
+        self.assertEqual(mg.elements[1].frontIndex, 1.33)
+        self.assertEqual(mg.elements[1].backIndex, 1.33)
+
     def testSetItemSingleIndexOutOfBounds(self):
         mg = MatrixGroup()
         with self.assertRaises(IndexError):
@@ -510,6 +733,14 @@ class TestMatrixGroup(envtest.RaytracingTestCase):
         mg[0] = space
         self.assertListEqual(mg.elements, [space, lens, space])
 
+    def testSetItemMismatchedIndices(self):
+        elements = [Space(10), Lens(10), Space(10)]
+        mg = MatrixGroup(elements)
+        with self.assertRaises(ValueError):
+            mg[1:2] = DielectricInterface(1.33, 1, 10)
+        self.assertListEqual(mg.elements, elements)
+        self.assertEqual(mg, MatrixGroup(elements))
+
     def testEqualityDifferentClassInstance(self):
         mg = MatrixGroup()
         self.assertNotEqual(mg, Matrix())
@@ -591,6 +822,14 @@ class TestSaveAndLoadMatrixGroup(envtest.RaytracingTestCase):
         mg = MatrixGroup([Space(20), ThickLens(1.22, 10, 10, 10)])
         self.assertSaveNotFailed(mg, self.fileName)
 
+    def testSaveCompiledNestedGroup(self):
+        fname = self.tempFilePath("compiledMG.pkl")
+        space = Space(10)
+        nestedGroup = MatrixGroup([space, Lens(10)])
+        nestedGroup.compile([space])
+        mg = MatrixGroup([nestedGroup, Space(10)])
+        self.assertSaveNotFailed(mg, fname)
+
     @envtest.skipIf(not testSaveHugeFiles, "Don't test saving a lot of matrices")
     def testSaveHugeFile(self):
         fname = self.tempFilePath("hugeFile.pkl")
@@ -655,6 +894,24 @@ class TestSaveAndLoadMatrixGroup(envtest.RaytracingTestCase):
         self.assertLoadNotFailed(mg2, fname)
         self.assertLoadEqualsMatrixGroup(mg2, mg1)
 
+    def testLoadWithoutCache(self):
+        fname = self.tempFilePath("withoutCache.pkl")
+        mg1 = MatrixGroup([Space(10), thorlabs.AC254_050_A(), Space(10)])
+
+        # The groups were saved with all their attributes before the cache was added
+        def stateWithoutCache(group):
+            return {key: value for key, value in group.__dict__.items() if key != '_cache'}
+
+        with patch.object(MatrixGroup, '__getstate__', stateWithoutCache):
+            self.assertSaveNotFailed(mg1, fname)
+
+        mg2 = MatrixGroup()
+        self.assertLoadNotFailed(mg2, fname)
+        self.assertLoadEqualsMatrixGroup(mg2, mg1)
+        self.assertEqual(mg2.trace(Ray(1, 0))[-1], mg1.trace(Ray(1, 0))[-1])
+        self.assertEqual(mg2.largestDiameter, mg1.largestDiameter)
+        self.assertEqual(mg2.elements[1].transferMatrix(upTo=3).B, mg1.elements[1].transferMatrix(upTo=3).B)
+
     @envtest.skipIf(not testSaveHugeFiles, "Don't test saving a lot of matrices")
     def testSaveThenLoadHugeFile(self):
         fname = self.tempFilePath("hugeFile.pkl")